@@ -0,0 +1,159 @@
+import io
+import itertools
+import json
+
+import av
+import speech_recognition as sr
+import streamlit as st
+import urllib3
+from speech_recognition.recognizers import google
+from vosk import KaldiRecognizer, Model, SetLogLevel
+
+SAMPLE_RATE = 16000  # Hz, mono 16-bit PCM is all the recognizer needs
+VOSK_CHUNK_BYTES = 4000  # PCM fed to Vosk per call (125 ms at 16 kHz)
+
+
+class PooledRecognizer(sr.Recognizer):
+    """Recognizer whose Google requests share a keep-alive connection pool.
+
+    The stock ``recognize_google`` opens a new connection with ``urlopen`` on
+    every call. This reuses SpeechRecognition's own request builder and
+    response parser and only swaps the transport for a ``urllib3.PoolManager``,
+    which, unlike ``requests.Session``, is safe to share between the script
+    threads of concurrent browser sessions.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.http = urllib3.PoolManager(retries=False)
+
+    def recognize_google_flac(
+        self, flac_data: bytes, sample_rate: int, language: str = "en-US"
+    ) -> str:
+        """Like ``recognize_google`` for audio that is already FLAC-encoded,
+        skipping ``AudioData.get_flac_data`` and its ``flac`` subprocess."""
+        builder = google.create_request_builder(
+            endpoint=google.ENDPOINT, language=language
+        )
+        try:
+            response = self.http.request(
+                "POST",
+                builder.build_url(),
+                body=flac_data,
+                headers={"Content-Type": f"audio/x-flac; rate={sample_rate}"},
+                timeout=self.operation_timeout,
+            )
+        except urllib3.exceptions.HTTPError as e:
+            raise sr.RequestError(f"recognition connection failed: {e}")
+        if response.status >= 400:
+            raise sr.RequestError(
+                f"recognition request failed: {response.status} {response.reason}"
+            )
+
+        parser = google.OutputParser(show_all=False, with_confidence=False)
+        return parser.parse(response.data.decode("utf-8"))
+
+
+@st.cache_resource
+def get_recognizer() -> PooledRecognizer:
+    """Shared recognizer (and connection pool), created once per server process."""
+    return PooledRecognizer()
+
+
+@st.cache_resource
+def get_vosk_model() -> Model:
+    """Offline English model, downloaded on first use and loaded once per
+    server process."""
+    SetLogLevel(-1)  # Kaldi otherwise logs every loading step to stderr
+    return Model(lang="en-us")
+
+
+def recognize_vosk(pcm: bytes) -> str:
+    """Transcribe 16 kHz mono 16-bit PCM locally with Vosk. Raises the same
+    SpeechRecognition exceptions as the Google path."""
+    try:
+        model = get_vosk_model()
+    except Exception as e:
+        raise sr.RequestError(f"could not load the offline model: {e}")
+
+    recognizer = KaldiRecognizer(model, SAMPLE_RATE)
+    utterances = []
+    for offset in range(0, len(pcm), VOSK_CHUNK_BYTES):
+        # True means an utterance just ended; Result() must be read before the
+        # next one starts or it is lost
+        if recognizer.AcceptWaveform(pcm[offset : offset + VOSK_CHUNK_BYTES]):
+            utterances.append(json.loads(recognizer.Result())["text"])
+    utterances.append(json.loads(recognizer.FinalResult())["text"])
+
+    text = " ".join(utterance for utterance in utterances if utterance)
+    if not text:
+        raise sr.UnknownValueError()
+    return text
+
+
+def decode_audio(source) -> bytes:
+    """Decode an audio file or file-like object to 16 kHz mono 16-bit PCM.
+
+    Runs FFmpeg in-process through PyAV, so no subprocess or temp file is
+    needed; MP3, PCM WAV and ADPCM WAV are all detected automatically.
+    """
+    with av.open(source) as container:
+        if not container.streams.audio:
+            raise ValueError("file contains no audio stream")
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+
+        # bytearray += grows geometrically, so accumulating is amortised O(N);
+        # the header duration is not trusted to size the buffer up front
+        pcm = bytearray()
+        # A trailing None flushes the samples still buffered in the resampler
+        for frame in itertools.chain(container.decode(stream), [None]):
+            for resampled in resampler.resample(frame):
+                # Plane buffers are padded; keep only the real samples
+                pcm += memoryview(resampled.planes[0])[: resampled.samples * 2]
+    return bytes(pcm)
+
+
+def encode_flac(pcm: bytes) -> bytes:
+    """Encode 16 kHz mono 16-bit PCM as FLAC in-process with PyAV."""
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="flac") as output:
+        stream = output.add_stream("flac", rate=SAMPLE_RATE, layout="mono")
+        stream.format = "s16"
+        # One frame for the whole clip; the encoder splits it into FLAC blocks
+        frame = av.AudioFrame(format="s16", layout="mono", samples=len(pcm) // 2)
+        frame.sample_rate = SAMPLE_RATE
+        frame.planes[0].update(pcm)
+        output.mux(stream.encode(frame))
+        output.mux(stream.encode(None))
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=32, persist="disk", show_spinner=False)
+def transcribe_audio(audio_digest: str, _uploaded_file, offline: bool = False) -> str:
+    """Transcribe an upload with Google, or locally with Vosk if ``offline``.
+    Cached on disk by content digest and backend, so the same voicemail is
+    only recognised once, even across sessions and restarts
+    (``_uploaded_file`` is not hashed).
+
+    Persisted entries never expire, so only outcomes that depend on the audio
+    alone are returned; service and unexpected errors propagate uncached.
+    Nothing is written to the page here, as cached elements are replayed to
+    every later caller.
+    """
+    try:
+        _uploaded_file.seek(0)
+        pcm = decode_audio(_uploaded_file)
+    except (av.FFmpegError, ValueError) as e:
+        return f"❗ Error loading audio file: {str(e)}"
+
+    if not pcm:
+        return "❗ Decoded audio is empty"
+
+    try:
+        if offline:
+            return recognize_vosk(pcm)
+        flac_data = encode_flac(pcm)
+        return get_recognizer().recognize_google_flac(flac_data, SAMPLE_RATE)
+    except sr.UnknownValueError:
+        return "❗ Speech recognition could not understand the audio."